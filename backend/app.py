@@ -1,7 +1,25 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, send_file, g, has_app_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import bindparam, event, inspect as sa_inspect, literal, or_, select, text
+from sqlalchemy.orm import declared_attr, load_only, selectinload, with_loader_criteria
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+from collections import OrderedDict, defaultdict, namedtuple
+from difflib import SequenceMatcher
 from datetime import datetime, timedelta
+from contextlib import contextmanager
+from functools import wraps
+from PIL import Image, UnidentifiedImageError
+import hashlib
+import itertools
+import random
+import re
+import tempfile
+import threading
+import time
 import os
 import json
 from decimal import Decimal  # Make sure this is imported
@@ -12,23 +30,167 @@ app = Flask(__name__)
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Use environment variable for DB if available (Production), else fallback to SQLite (Local)
-database_url = os.environ.get('DATABASE_URL')
-if database_url and database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+def normalize_database_url(url):
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+database_url = normalize_database_url(os.environ.get('DATABASE_URL'))
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///' + os.path.join(basedir, 'expense_manager.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'expense-manager-secret-key-2024'
 
-db = SQLAlchemy(app)
+# Optional read replicas (comma-separated URLs). Read-only GET routes are spread
+# across them round-robin; everything else stays on the primary.
+replica_urls = [normalize_database_url(url.strip()) for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+app.config['SQLALCHEMY_BINDS'] = {f'replica_{i}': url for i, url in enumerate(replica_urls)}
+app.config['READ_REPLICA_KEYS'] = list(app.config['SQLALCHEMY_BINDS'])
+app.config['READ_YOUR_WRITES_SECONDS'] = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+app.config['REPLICA_RETRY_SECONDS'] = float(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+
+# Tenants that live in their own database, as JSON: {"<company_id>": "<database url>"}.
+# Every other company shares the primary database.
+DEFAULT_COMPANY_ID = 1
+tenant_urls = json.loads(os.environ.get('TENANT_DATABASE_URLS') or '{}')
+app.config['TENANT_BINDS'] = {int(company_id): f'tenant_{int(company_id)}' for company_id in tenant_urls}
+app.config['SQLALCHEMY_BINDS'].update({f'tenant_{int(company_id)}': normalize_database_url(url) for company_id, url in tenant_urls.items()})
+
+def current_company_id():
+    return g.get('company_id') if has_app_context() else None
+
+@contextmanager
+def tenant_context(company_id):
+    previous = g.get('company_id')
+    g.company_id = company_id
+    try:
+        yield
+    finally:
+        g.company_id = previous
+
+# Read/write routing
+# Tenant rows go to the tenant's own database, read-only requests to a replica, the rest to the primary
+class RoutingSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            tenant_key = app.config['TENANT_BINDS'].get(g.get('company_id'))
+            if tenant_key is not None and mapper is not None and issubclass(sa_inspect(mapper).class_, TenantMixin):
+                return self._db.engines[tenant_key]
+            replica_key = g.get('read_replica')
+            if replica_key is not None and not self._flushing:
+                return self._db.engines[replica_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+_replica_cycle = itertools.count()
+_replica_down_until = {}
+_recent_writers = {}
+_routing_lock = threading.Lock()
+
+def _writer_key():
+    user_id = request.headers.get('X-User-Id') or (request.view_args or {}).get('user_id')
+    if user_id is None and request.is_json:
+        user_id = (request.get_json(silent=True) or {}).get('user_id')
+    return str(user_id) if user_id is not None else None
+
+def _recently_wrote():
+    if request.cookies.get('rw_sticky'):
+        return True
+    key = _writer_key()
+    if key is None:
+        return False
+    with _routing_lock:
+        return _recent_writers.get(key, 0) > time.monotonic()
+
+# Next healthy replica bind key, or None for the primary
+def choose_read_replica():
+    keys = app.config['READ_REPLICA_KEYS']
+    if not keys or current_company_id() in app.config['TENANT_BINDS'] or _recently_wrote():
+        return None
+    now = time.monotonic()
+    with _routing_lock:
+        start = next(_replica_cycle)
+        for offset in range(len(keys)):
+            key = keys[(start + offset) % len(keys)]
+            if _replica_down_until.get(key, 0) <= now:
+                return key
+    return None
+
+def mark_replica_down(key):
+    with _routing_lock:
+        _replica_down_until[key] = time.monotonic() + app.config['REPLICA_RETRY_SECONDS']
+
+# Serve a GET route from a read replica, falling back to the primary if it fails
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = choose_read_replica()
+        try:
+            return view(*args, **kwargs)
+        except OperationalError:
+            if g.read_replica is None:
+                raise
+            mark_replica_down(g.read_replica)
+            db.session.rollback()
+            g.read_replica = None
+            return view(*args, **kwargs)
+    return wrapper
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+# Receipt storage (content-addressed by SHA-256 on local disk)
+app.config['RECEIPT_STORAGE_DIR'] = os.environ.get('RECEIPT_STORAGE_DIR') or os.path.join(basedir, 'receipts')
+app.config['RECEIPT_MAX_BYTES'] = int(os.environ.get('RECEIPT_MAX_BYTES', 20 * 1024 * 1024))
+# Werkzeug buffers multipart forms before the view runs, so cap request bodies too (with room for form overhead)
+app.config['MAX_CONTENT_LENGTH'] = app.config['RECEIPT_MAX_BYTES'] + 64 * 1024
+# Let nginx/Apache serve receipt files directly instead of streaming them through Python
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+
+RECEIPT_CHUNK_SIZE = 64 * 1024
+RECEIPT_CONTENT_TYPES = ('application/pdf', 'image/jpeg', 'image/png', 'image/webp', 'image/gif')
+RECEIPT_THUMBNAIL_SIZES = (128, 256, 512)
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+# Approval routing
+app.config['POLICY_CACHE_SECONDS'] = float(os.environ.get('POLICY_CACHE_SECONDS', 60))
+DEFAULT_APPROVAL_LEVELS = 2  # Manager + admin, unless a policy asks for a different number
+WRITE_CONFLICT_MAX_ATTEMPTS = 5  # Retries when concurrent requests touch the same expense
+
+# Duplicate audit looks back this many days unless given a date_from
+DUPLICATE_AUDIT_DAYS = 90
+
+# Serialized expenses kept in memory per worker
+app.config['EXPENSE_CACHE_MAX_BYTES'] = int(os.environ.get('EXPENSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # [Your existing models and routes continue here...]
 
 # Enhanced Models
-class User(db.Model):
+class Company(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    base_currency = db.Column(db.String(3), default='USD')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'base_currency': self.base_currency
+        }
+
+# Rows owned by a company; queries are filtered to the current company automatically
+class TenantMixin:
+    @declared_attr
+    def company_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False, index=True, default=DEFAULT_COMPANY_ID)
+
+class User(TenantMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('company_id', 'email', name='uq_user_company_email'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), nullable=False)
     password = db.Column(db.String(200), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=False)
@@ -48,10 +210,16 @@ class User(db.Model):
             'department': self.department,
             'manager_id': self.manager_id,
             'manager_name': self.manager.name if self.manager else None,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'company_id': self.company_id
         }
 
-class Expense(db.Model):
+class Expense(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_expense_company_submitted', 'company_id', 'submitted_at'),
+        db.Index('ix_expense_company_status', 'company_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -64,11 +232,18 @@ class Expense(db.Model):
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     receipt_url = db.Column(db.String(500))
     tags = db.Column(db.String(500))  # JSON string for multiple tags
+    fingerprint = db.Column(db.String(64), index=True)  # See expense_fingerprint()
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped whenever the expense or its steps change
+    budget_periods = db.Column(db.String(500))  # JSON list of BudgetPeriod ids this expense is charged to
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=True)
     
     user = db.relationship('User', backref='expenses')
     approval_steps = db.relationship('ApprovalStep', backref='expense', lazy=True, cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='expense', lazy=True)
 
+    # Updates only apply if the row still has the version we read (see touch_expense)
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
+
     def to_dict(self, include_steps=False, include_comments=False):
         result = {
             'id': self.id,
@@ -84,7 +259,9 @@ class Expense(db.Model):
             'status': self.status,
             'submitted_at': self.submitted_at.isoformat(),
             'receipt_url': self.receipt_url,
-            'tags': json.loads(self.tags) if self.tags else []
+            'tags': json.loads(self.tags) if self.tags else [],
+            'duplicate_of': self.duplicate_of_id,
+            'possible_duplicate': self.duplicate_of_id is not None
         }
         
         if include_steps:
@@ -95,7 +272,124 @@ class Expense(db.Model):
         
         return result
 
-class ApprovalStep(db.Model):
+def normalize_title(title):
+    return ' '.join(re.findall(r'[a-z0-9]+', (title or '').lower()))
+
+# Same user, amount, currency, date and normalized title -> same fingerprint
+def expense_fingerprint(user_id, amount, currency, date, title):
+    key = '|'.join([
+        str(user_id),
+        str(Decimal(str(amount)).quantize(Decimal('0.01'))),
+        currency or 'USD',
+        date.isoformat(),
+        normalize_title(title)
+    ])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+@event.listens_for(Expense, 'before_insert')
+@event.listens_for(Expense, 'before_update')
+def set_expense_fingerprint(mapper, connection, expense):
+    expense.fingerprint = expense_fingerprint(expense.user_id, expense.amount, expense.currency, expense.date, expense.title)
+
+# Sparse fieldsets for list endpoints: field -> (columns it reads, how to render it)
+EXPENSE_FIELDS = {
+    'id': ((), lambda e: e.id),
+    'user_id': ((Expense.user_id,), lambda e: e.user_id),
+    'submitter_name': ((Expense.user_id,), lambda e: e.user.name),
+    'submitter_department': ((Expense.user_id,), lambda e: e.user.department),
+    'title': ((Expense.title,), lambda e: e.title),
+    'description': ((Expense.description,), lambda e: e.description),
+    'amount': ((Expense.amount,), lambda e: float(e.amount)),
+    'currency': ((Expense.currency,), lambda e: e.currency),
+    'category': ((Expense.category,), lambda e: e.category),
+    'date': ((Expense.date,), lambda e: e.date.isoformat()),
+    'status': ((Expense.status,), lambda e: e.status),
+    'submitted_at': ((Expense.submitted_at,), lambda e: e.submitted_at.isoformat()),
+    'receipt_url': ((Expense.receipt_url,), lambda e: e.receipt_url),
+    'tags': ((Expense.tags,), lambda e: json.loads(e.tags) if e.tags else []),
+    'duplicate_of': ((Expense.duplicate_of_id,), lambda e: e.duplicate_of_id),
+    'possible_duplicate': ((Expense.duplicate_of_id,), lambda e: e.duplicate_of_id is not None)
+}
+EXPENSE_INCLUDES = ('approval_steps',)
+
+# Bump the version: drops cached copies, and is the optimistic lock (see retry_on_conflict)
+def touch_expense(expense):
+    expense.version = (expense.version or 1) + 1
+
+def is_write_conflict(error):
+    if isinstance(error, StaleDataError):
+        return True
+    return isinstance(error, OperationalError) and 'locked' in str(error.orig).lower()
+
+# Re-run a view's write when another request changed the expense first; 409 once out of attempts
+def retry_on_conflict(write, *args):
+    for attempt in range(WRITE_CONFLICT_MAX_ATTEMPTS):
+        try:
+            return write(*args)
+        except (StaleDataError, OperationalError) as e:
+            db.session.rollback()
+            if not is_write_conflict(e):
+                raise
+            if attempt == WRITE_CONFLICT_MAX_ATTEMPTS - 1:
+                return jsonify({'success': False, 'error': 'Expense is being updated by someone else, please retry'}), 409
+            # Back off with jitter before reading the expense again
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+# Size-bounded LRU of serialized expenses, stamped with the row version they were built from
+class ExpenseFragmentCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (version, fragment, expires_at)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == version and (entry[2] is None or entry[2] > datetime.utcnow()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, fragment, expires_at=None):
+        if len(fragment) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.size -= len(previous[1])
+            self.entries[key] = (version, fragment, expires_at)
+            self.size += len(fragment)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted[1])
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+expense_cache = ExpenseFragmentCache(app.config['EXPENSE_CACHE_MAX_BYTES'])
+
+class ApprovalStep(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_approval_step_company_approver', 'company_id', 'approver_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
     approver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -105,9 +399,12 @@ class ApprovalStep(db.Model):
     decided_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     due_date = db.Column(db.DateTime)  # Approval deadline
+    version = db.Column(db.Integer, nullable=False, default=1)
     
     approver = db.relationship('User', backref='approval_steps')
 
+    __mapper_args__ = {'version_id_col': version}
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -122,7 +419,7 @@ class ApprovalStep(db.Model):
             'is_overdue': self.due_date and datetime.utcnow() > self.due_date
         }
 
-class Comment(db.Model):
+class Comment(TenantMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -142,12 +439,19 @@ class Comment(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
-class Policy(db.Model):
+class Policy(TenantMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    category = db.Column(db.String(50), nullable=False)
+    category = db.Column(db.String(50), nullable=False, index=True)
     max_amount = db.Column(db.Numeric(10, 2), nullable=False)
     requires_receipt = db.Column(db.Boolean, default=True)
-    approval_threshold = db.Column(db.Numeric(10, 2), default=0)  # Amount that triggers additional approvals
+    approval_threshold = db.Column(db.Numeric(10, 2))  # Amount that triggers an additional approval; NULL for none
+    approval_levels = db.Column(db.Integer, default=DEFAULT_APPROVAL_LEVELS)  # Approvers needed up to the threshold (+1 above it)
+    # Optional scope; NULL means the policy applies to any value
+    department = db.Column(db.String(50))
+    role = db.Column(db.String(20))
+    currency = db.Column(db.String(3))
+    valid_from = db.Column(db.Date)
+    valid_to = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -156,10 +460,129 @@ class Policy(db.Model):
             'category': self.category,
             'max_amount': float(self.max_amount),
             'requires_receipt': self.requires_receipt,
-            'approval_threshold': float(self.approval_threshold)
+            'approval_threshold': float(self.approval_threshold) if self.approval_threshold is not None else None,
+            'approval_levels': self.approval_levels,
+            'department': self.department,
+            'role': self.role,
+            'currency': self.currency,
+            'valid_from': self.valid_from.isoformat() if self.valid_from else None,
+            'valid_to': self.valid_to.isoformat() if self.valid_to else None
+        }
+
+PolicyRule = namedtuple('PolicyRule', [
+    'policy_id', 'category', 'max_amount', 'approval_threshold', 'approval_levels',
+    'requires_receipt', 'role', 'currency', 'valid_from', 'valid_to'
+])
+
+# Policies compiled into tuples, bucketed by (category, department); the most specific rule wins
+class PolicyEngine:
+    def __init__(self, policies):
+        self.buckets = defaultdict(list)
+        for policy in policies:
+            self.buckets[(policy.category, policy.department)].append(PolicyRule(
+                policy.id,
+                policy.category,
+                Decimal(policy.max_amount),
+                # No threshold: nothing under the limit needs an extra approval
+                Decimal(policy.approval_threshold if policy.approval_threshold is not None else policy.max_amount),
+                policy.approval_levels or DEFAULT_APPROVAL_LEVELS,
+                bool(policy.requires_receipt),
+                policy.role,
+                policy.currency,
+                policy.valid_from,
+                policy.valid_to
+            ))
+        for rules in self.buckets.values():
+            rules.sort(key=lambda r: (r.role is not None) + (r.currency is not None)
+                       + (r.valid_from is not None or r.valid_to is not None), reverse=True)
+
+    def match(self, category, department=None, role=None, currency='USD', on_date=None):
+        for key in ((category, department), (category, None)):
+            for rule in self.buckets.get(key, ()):
+                if rule.role is not None and rule.role != role:
+                    continue
+                if rule.currency is not None and rule.currency != currency:
+                    continue
+                if on_date is not None and ((rule.valid_from and on_date < rule.valid_from)
+                                            or (rule.valid_to and on_date > rule.valid_to)):
+                    continue
+                return rule
+        return None
+
+    @staticmethod
+    def decide(rule, amount, category):
+        if rule is None:
+            return {'compliant': True, 'message': '', 'requires_receipt': False,
+                    'approval_levels': DEFAULT_APPROVAL_LEVELS, 'policy_id': None}
+
+        decision = {'compliant': True, 'message': '', 'requires_receipt': rule.requires_receipt,
+                    'approval_levels': rule.approval_levels, 'policy_id': rule.policy_id}
+        if amount > rule.max_amount:
+            decision['compliant'] = False
+            decision['message'] = f'Amount exceeds ${rule.max_amount} limit for {category}'
+        elif amount > rule.approval_threshold:
+            decision['approval_levels'] += 1
+            decision['message'] = f'Amount exceeds ${rule.approval_threshold} threshold, additional approval required'
+        return decision
+
+    def evaluate(self, amount, category, department=None, role=None, currency='USD', on_date=None):
+        rule = self.match(category, department, role, currency, on_date)
+        return self.decide(rule, amount, category)
+
+    # Match each distinct scope only once
+    def evaluate_batch(self, items):
+        rules = {}
+        decisions = []
+        for item in items:
+            scope = (item['category'], item.get('department'), item.get('role'),
+                     item.get('currency', 'USD'), item.get('date'))
+            if scope not in rules:
+                rules[scope] = self.match(*scope)
+            decisions.append(self.decide(rules[scope], Decimal(str(item['amount'])), item['category']))
+        return decisions
+
+_policy_engines = {}  # company_id -> (PolicyEngine, expires_at)
+_policy_engine_lock = threading.Lock()
+
+def get_policy_engine():
+    company_id = current_company_id()
+    with _policy_engine_lock:
+        engine, expires_at = _policy_engines.get(company_id, (None, 0.0))
+        if engine is None or time.monotonic() >= expires_at:
+            engine = PolicyEngine(Policy.query.all())
+            _policy_engines[company_id] = (engine, time.monotonic() + app.config['POLICY_CACHE_SECONDS'])
+        return engine
+
+def invalidate_policy_engine():
+    with _policy_engine_lock:
+        _policy_engines.pop(current_company_id(), None)
+
+class Receipt(TenantMixin, db.Model):
+    # Each company keeps its own row (and so its own dedup), while the file on disk is shared
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), primary_key=True, default=DEFAULT_COMPANY_ID)
+    sha256 = db.Column(db.String(64), primary_key=True)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def url(self):
+        return f'/api/receipts/{self.sha256}'
+
+    def to_dict(self):
+        return {
+            'sha256': self.sha256,
+            'content_type': self.content_type,
+            'size': self.size,
+            'url': self.url,
+            'thumbnail_url': f'{self.url}/thumbnail' if self.content_type.startswith('image/') else None
         }
 
-class Notification(db.Model):
+class Notification(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_notification_company_user', 'company_id', 'user_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -183,11 +606,306 @@ class Notification(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def scope_to_tenant(orm_execute_state):
+    company_id = current_company_id()
+    if company_id is None or orm_execute_state.execution_options.get('all_tenants'):
+        return
+    if orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(TenantMixin, lambda cls: cls.company_id == company_id, include_aliases=True)
+        )
+
+@event.listens_for(RoutingSession, 'before_flush')
+def assign_tenant(session, flush_context, instances):
+    company_id = current_company_id()
+    for obj in session.new:
+        if isinstance(obj, TenantMixin) and obj.company_id is None and company_id is not None:
+            obj.company_id = company_id
+
+# Monthly spending limit for one user or one department, optionally for a single category
+class Budget(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_budget_company_user', 'company_id', 'user_id'),
+        db.Index('ix_budget_company_department', 'company_id', 'department'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    department = db.Column(db.String(50), nullable=True)
+    category = db.Column(db.String(50), nullable=True)  # NULL covers every category
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
+    is_hard = db.Column(db.Boolean, default=True)  # Block submissions over budget; otherwise only warn
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, period=None):
+        committed = period.committed if period else Decimal('0')
+        spent = period.spent if period else Decimal('0')
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'department': self.department,
+            'category': self.category,
+            'amount': float(self.amount),
+            'is_hard': self.is_hard,
+            'committed': float(committed),
+            'spent': float(spent),
+            'remaining': float(self.amount - committed - spent)
+        }
+
+# Running totals for one budget's month
+class BudgetPeriod(TenantMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('budget_id', 'period_start', name='uq_budget_period'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    budget_id = db.Column(db.Integer, db.ForeignKey('budget.id'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)  # First day of the month
+    committed = db.Column(db.Numeric(12, 2), nullable=False, default=0)  # Submitted, awaiting approval
+    spent = db.Column(db.Numeric(12, 2), nullable=False, default=0)  # Approved
+
+# One row per change to a synced model; seq is handed out at commit (see assign_change_sequence)
+class ChangeLog(TenantMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_change_log_company_sequence', 'company_id', 'seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # upsert, delete
+    owner_id = db.Column(db.Integer)  # Recipient, for rows only one user may see (notifications)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Last change sequence handed out for a company
+class ChangeSequence(TenantMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('company_id', name='uq_change_sequence_company'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# Models clients can sync through /api/changes, keyed by the name used in the response
+SYNCED_MODELS = {
+    'expenses': Expense,
+    'approval_steps': ApprovalStep,
+    'comments': Comment,
+    'notifications': Notification
+}
+SYNCED_TABLES = {model.__tablename__: name for name, model in SYNCED_MODELS.items()}
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_changes(session, flush_context):
+    changes = []
+    for operation, objects in (('upsert', session.new), ('upsert', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if obj.__tablename__ not in SYNCED_TABLES:
+                continue
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            changes.append({
+                'company_id': obj.company_id,
+                'table_name': obj.__tablename__,
+                'row_id': obj.id,
+                'operation': operation,
+                'owner_id': obj.user_id if isinstance(obj, Notification) else None,
+                'created_at': datetime.utcnow()
+            })
+    if not changes:
+        return
+
+    connection = session.connection(bind_arguments={'mapper': ChangeLog})
+    pending = session.info.setdefault('unsequenced_changes', defaultdict(set))
+    for change in changes:
+        result = connection.execute(ChangeLog.__table__.insert().values(**change))
+        pending[change['company_id']].add(result.inserted_primary_key[0])
+
+# The counter row stays locked until commit, so sequences become visible in commit order
+def assign_change_sequence(connection, company_id, change_ids):
+    counter = ChangeSequence.__table__
+    count = len(change_ids)
+    updated = connection.execute(
+        counter.update().where(counter.c.company_id == company_id).values(value=counter.c.value + count)
+    )
+    if updated.rowcount == 0:
+        connection.execute(counter.insert().values(company_id=company_id, value=count))
+    last = connection.execute(select(counter.c.value).where(counter.c.company_id == company_id)).scalar_one()
+
+    change_log = ChangeLog.__table__
+    connection.execute(
+        change_log.update().where(change_log.c.id == bindparam('change_id')).values(seq=bindparam('change_seq')),
+        [{'change_id': change_id, 'change_seq': last - count + n + 1} for n, change_id in enumerate(sorted(change_ids))]
+    )
+
+@event.listens_for(RoutingSession, 'before_commit')
+def sequence_changes(session):
+    session.flush()
+    pending = session.info.pop('unsequenced_changes', None)
+    if pending:
+        connection = session.connection(bind_arguments={'mapper': ChangeLog})
+        for company_id, change_ids in pending.items():
+            assign_change_sequence(connection, company_id, change_ids)
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def forget_unsequenced_changes(session, transaction):
+    # Rows from a rolled-back transaction are gone; don't carry their ids into the next one
+    if transaction.parent is None:
+        session.info.pop('unsequenced_changes', None)
+
+# Create the counter row up front so concurrent first writers don't both insert it
+def ensure_change_sequence(company_id):
+    with tenant_context(company_id):
+        if not ChangeSequence.query.first():
+            db.session.add(ChangeSequence(company_id=company_id, value=0))
+
+# Change-log rows from before sequences existed keep their id as sequence
+def backfill_change_sequence():
+    change_log = ChangeLog.__table__
+    counter = ChangeSequence.__table__
+    connection = db.session.connection(bind_arguments={'mapper': ChangeLog})
+    connection.execute(change_log.update().where(change_log.c.seq.is_(None)).values(seq=change_log.c.id))
+    for company_id, last in connection.execute(
+        select(change_log.c.company_id, db.func.max(change_log.c.seq)).group_by(change_log.c.company_id)
+    ):
+        if connection.execute(counter.update().where(counter.c.company_id == company_id).values(value=last)).rowcount == 0:
+            connection.execute(counter.insert().values(company_id=company_id, value=last))
+    db.session.commit()
+
 # Initialize database
+# Columns, indexes and keys the existing tables lack; create_all only adds missing tables
+def pending_schema_changes(engine):
+    inspector = sa_inspect(engine)
+    columns = []
+    indexes = []
+    rekeyed = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        columns.extend((table, column) for column in table.columns if column.name not in existing)
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        indexes.extend(index for index in table.indexes if index.name not in existing_indexes)
+        # Primary key or unique constraints changed, e.g. made per company
+        primary_key = set(inspector.get_pk_constraint(table.name)['constrained_columns'])
+        if primary_key != {column.name for column in table.primary_key} or existing_unique_keys(inspector, table.name) != unique_keys(table):
+            rekeyed.append(table)
+    return columns, indexes, rekeyed
+
+def unique_keys(table):
+    keys = {tuple(sorted(column.name for column in constraint.columns))
+            for constraint in table.constraints if isinstance(constraint, db.UniqueConstraint)}
+    return keys | {tuple(sorted(column.name for column in index.columns)) for index in table.indexes if index.unique}
+
+def existing_unique_keys(inspector, table_name):
+    keys = {tuple(sorted(constraint['column_names'])) for constraint in inspector.get_unique_constraints(table_name)}
+    return keys | {tuple(sorted(index['column_names'])) for index in inspector.get_indexes(table_name) if index['unique']}
+
+# Only run by `flask --app app upgrade-db`, so workers starting together don't race on ALTER TABLE
+def upgrade_schema(engine):
+    columns, indexes, rekeyed = pending_schema_changes(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table, column in columns:
+            ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}'
+            if column.default is not None and column.default.is_scalar:
+                default = literal(column.default.arg).compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True})
+                ddl += f' DEFAULT {default}'
+            connection.execute(text(ddl))
+        inspector = sa_inspect(connection)
+        for table in rekeyed:
+            if engine.dialect.name == 'sqlite':
+                rebuild_sqlite_table(connection, inspector, table)
+            else:
+                rekey_table(connection, inspector, table)
+        for index in indexes:
+            # A rebuilt SQLite table already got its indexes from CREATE TABLE
+            if not (engine.dialect.name == 'sqlite' and index.table in rekeyed):
+                index.create(connection)
+
+def rebuild_sqlite_table(connection, inspector, table):
+    # SQLite can't change keys in place, so copy the rows into a freshly created table
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    old_name = preparer.quote(f'{table.name}_old')
+    for index in inspector.get_indexes(table.name):
+        connection.execute(text(f'DROP INDEX {preparer.quote(index["name"])}'))
+    # Leave other tables' foreign keys pointing at the table name rather than the renamed copy
+    connection.execute(text('PRAGMA legacy_alter_table = ON'))
+    connection.execute(text(f'ALTER TABLE {name} RENAME TO {old_name}'))
+    table.create(connection)
+    column_names = ', '.join(preparer.format_column(column) for column in table.columns)
+    connection.execute(text(f'INSERT INTO {name} ({column_names}) SELECT {column_names} FROM {old_name}'))
+    connection.execute(text(f'DROP TABLE {old_name}'))
+    connection.execute(text('PRAGMA legacy_alter_table = OFF'))
+
+def rekey_table(connection, inspector, table):
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    primary_key = inspector.get_pk_constraint(table.name)
+    if set(primary_key['constrained_columns']) != {column.name for column in table.primary_key}:
+        connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT {preparer.quote(primary_key["name"])}'))
+        connection.execute(AddConstraint(table.primary_key))
+    wanted = unique_keys(table)
+    for constraint in inspector.get_unique_constraints(table.name):
+        if tuple(sorted(constraint['column_names'])) not in wanted:
+            connection.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT {preparer.quote(constraint["name"])}'))
+    for index in inspector.get_indexes(table.name):
+        if index['unique'] and not index.get('duplicates_constraint') and tuple(sorted(index['column_names'])) not in wanted:
+            connection.execute(text(f'DROP INDEX {preparer.quote(index["name"])}'))
+    existing = existing_unique_keys(inspector, table.name)
+    for constraint in table.constraints:
+        if isinstance(constraint, db.UniqueConstraint) and tuple(sorted(column.name for column in constraint.columns)) not in existing:
+            connection.execute(AddConstraint(constraint))
+
+def backfill_fingerprints():
+    for expense in Expense.query.filter(Expense.fingerprint.is_(None)).yield_per(500):
+        expense.fingerprint = expense_fingerprint(expense.user_id, expense.amount, expense.currency, expense.date, expense.title)
+    db.session.commit()
+
+# Copy the company row into its dedicated tenant database, if it has one
+def mirror_company(company_id):
+    bind_key = app.config['TENANT_BINDS'].get(company_id)
+    company = db.session.get(Company, company_id)
+    if bind_key is None or company is None:
+        return
+    with db.engines[bind_key].begin() as connection:
+        if connection.execute(select(Company.id).where(Company.id == company_id)).first() is None:
+            connection.execute(Company.__table__.insert().values(
+                id=company.id, name=company.name, base_currency=company.base_currency, created_at=company.created_at
+            ))
+
+# The primary plus every dedicated tenant database (replicas follow the primary)
+def schema_engines():
+    return [db.engine] + [db.engines[bind_key] for bind_key in app.config['TENANT_BINDS'].values()]
+
 def init_db():
     with app.app_context():
-        db.create_all()
+        # Replicas get their schema from the primary, so only create tables there
+        db.create_all(bind_key=None)
+        for bind_key in app.config['TENANT_BINDS'].values():
+            db.metadata.create_all(bind=db.engines[bind_key])
+        if any(any(pending_schema_changes(engine)) for engine in schema_engines()):
+            print("Database schema is out of date, run `flask --app app upgrade-db`")
+            return
+
+        if not db.session.get(Company, DEFAULT_COMPANY_ID):
+            try:
+                db.session.add(Company(id=DEFAULT_COMPANY_ID, name='Default Company'))
+                db.session.flush()
+                ensure_change_sequence(DEFAULT_COMPANY_ID)
+                db.session.commit()
+            except IntegrityError:
+                # Another worker created it first
+                db.session.rollback()
+        for company_id in app.config['TENANT_BINDS']:
+            mirror_company(company_id)
         
+        # Sample data belongs to the default company
+        g.company_id = DEFAULT_COMPANY_ID
+
         # Check if data exists to prevent overwriting/duplication
         if User.query.first():
             return
@@ -403,24 +1121,264 @@ def create_notification(user_id, title, message, type='info', expense_id=None):
     )
     db.session.add(notification)
 
-def check_policy_compliance(amount, category):
-    policy = Policy.query.filter_by(category=category).first()
-    if not policy:
-        return {'compliant': True, 'message': ''}
-    
-    if amount > policy.max_amount:
-        return {
-            'compliant': False,
-            'message': f'Amount exceeds ${policy.max_amount} limit for {category}'
-        }
-    
-    if amount > policy.approval_threshold:
-        return {
-            'compliant': True,
-            'message': f'Amount exceeds ${policy.approval_threshold} threshold, additional approval may be required'
-        }
-    
-    return {'compliant': True, 'message': ''}
+def check_policy_compliance(amount, category, user=None, currency='USD', on_date=None):
+    return get_policy_engine().evaluate(
+        amount,
+        category,
+        department=user.department if user else None,
+        role=user.role if user else None,
+        currency=currency,
+        on_date=on_date
+    )
+
+# Up the reporting line, then admins; one level means the direct manager only
+def build_approval_chain(user, levels):
+    managers = []
+    seen = {user.id}
+    manager = user.manager
+    while manager and manager.id not in seen:
+        managers.append(manager)
+        seen.add(manager.id)
+        manager = manager.manager
+
+    admins = User.query.filter_by(role='Admin').order_by(User.id).all()
+    if levels <= 1:
+        return managers[:1] or admins[:1]
+
+    admin_ids = {admin.id for admin in admins}
+    chain = [m for m in managers if m.id not in admin_ids][:levels - 1]
+    # When the reporting line is too short, further admins make up the missing levels
+    chain.extend(admins[:max(1, levels - len(chain))])
+    return chain
+
+def serialize_expense(expense):
+    fragment = app.json.dumps(expense.to_dict(include_steps=True)).encode('utf-8')
+    # 'is_overdue' flips once a waiting step passes its due date, so expire the fragment then
+    now = datetime.utcnow()
+    due_dates = [s.due_date for s in expense.approval_steps if s.status == 'Waiting' and s.due_date and s.due_date > now]
+    expense_cache.put((expense.company_id, expense.id), expense.version, fragment, min(due_dates) if due_dates else None)
+    return fragment
+
+def sparse_expense_response(expenses_query, key, fields, include):
+    columns = {column for field in fields for column in EXPENSE_FIELDS[field][0]}
+    options = [load_only(*columns)] if columns else [load_only(Expense.id)]
+    if {'submitter_name', 'submitter_department'} & set(fields):
+        options.append(selectinload(Expense.user).load_only(User.name, User.department))
+    if 'approval_steps' in include:
+        options.append(selectinload(Expense.approval_steps).selectinload(ApprovalStep.approver))
+
+    results = []
+    for expense in expenses_query.options(*options):
+        result = {field: EXPENSE_FIELDS[field][1](expense) for field in fields}
+        if 'approval_steps' in include:
+            result['approval_steps'] = [step.to_dict() for step in sorted(expense.approval_steps, key=lambda x: x.sequence)]
+        results.append(result)
+    return jsonify({'success': True, key: results})
+
+# Reuses cached fragments; ?fields= / ?include= switch to a sparse response
+def expense_list_response(expenses_query, key='expenses'):
+    if 'fields' in request.args or 'include' in request.args:
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or list(EXPENSE_FIELDS)
+        include = [i.strip() for i in request.args.get('include', '').split(',') if i.strip()]
+        unknown = [f for f in fields if f not in EXPENSE_FIELDS] + [i for i in include if i not in EXPENSE_INCLUDES]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f'Unknown fields: {", ".join(unknown)}',
+                'fields': list(EXPENSE_FIELDS),
+                'include': list(EXPENSE_INCLUDES)
+            }), 400
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        return sparse_expense_response(expenses_query, key, fields, include)
+
+    rows = expenses_query.with_entities(Expense.id, Expense.version).all()
+    company_id = current_company_id()
+    fragments = {}
+    missing = []
+    for expense_id, version in rows:
+        fragment = expense_cache.get((company_id, expense_id), version)
+        if fragment is None:
+            missing.append(expense_id)
+        else:
+            fragments[expense_id] = fragment
+
+    for start in range(0, len(missing), 500):
+        expenses = Expense.query.filter(Expense.id.in_(missing[start:start + 500])).options(
+            selectinload(Expense.user),
+            selectinload(Expense.approval_steps).selectinload(ApprovalStep.approver)
+        )
+        for expense in expenses:
+            fragments[expense.id] = serialize_expense(expense)
+
+    body = b''.join([
+        b'{"success": true, "', key.encode('utf-8'), b'": [',
+        b','.join(fragments[expense_id] for expense_id, _ in rows if expense_id in fragments),
+        b']}'
+    ])
+    return app.response_class(body, mimetype='application/json')
+
+def find_duplicate_expense(fingerprint):
+    return Expense.query.filter(
+        Expense.fingerprint == fingerprint,
+        Expense.status != 'Rejected'
+    ).order_by(Expense.id).first()
+
+# Expenses must arrive ordered by user, currency and amount so one block is in memory at a time
+def find_near_duplicates(expenses, max_days_apart=3, min_similarity=0.8):
+    matches = []
+    for _, block in itertools.groupby(expenses, key=lambda e: (e.user_id, e.currency, Decimal(str(e.amount)))):
+        block = list(block)
+        if len(block) < 2:
+            continue
+        block.sort(key=lambda e: (e.date, e.id))
+        titles = {e.id: normalize_title(e.title) for e in block}
+        for i, first in enumerate(block):
+            for second in block[i + 1:]:
+                days_apart = (second.date - first.date).days
+                if days_apart > max_days_apart:
+                    break
+                similarity = SequenceMatcher(None, titles[first.id], titles[second.id]).ratio()
+                if similarity >= min_similarity:
+                    matches.append({
+                        'expense_id': second.id,
+                        'duplicate_of': first.id,
+                        'user_id': first.user_id,
+                        'amount': float(first.amount),
+                        'days_apart': days_apart,
+                        'similarity': round(similarity, 3)
+                    })
+    return matches
+
+def applicable_budgets(user, category=None):
+    budgets_query = Budget.query.filter(or_(Budget.user_id == user.id, Budget.department == user.department))
+    if category is not None:
+        budgets_query = budgets_query.filter(or_(Budget.category.is_(None), Budget.category == category))
+    return budgets_query.all()
+
+def get_budget_period(budget, period_start):
+    period = BudgetPeriod.query.filter_by(budget_id=budget.id, period_start=period_start).first()
+    if period:
+        return period
+    try:
+        with db.session.begin_nested():
+            period = BudgetPeriod(budget_id=budget.id, period_start=period_start, committed=0, spent=0)
+            db.session.add(period)
+        return period
+    except IntegrityError:
+        # Another submission created it first
+        return BudgetPeriod.query.filter_by(budget_id=budget.id, period_start=period_start).one()
+
+# Hard budgets are checked and charged in one conditional UPDATE, so concurrent submissions cannot overshoot
+def reserve_budgets(user, category, amount, on_date):
+    period_start = on_date.replace(day=1)
+    result = {'within_budget': True, 'message': '', 'warnings': [], 'period_ids': []}
+    for budget in applicable_budgets(user, category):
+        period = get_budget_period(budget, period_start)
+        remaining = budget.amount - period.committed - period.spent
+        scope = 'Your' if budget.user_id else f'{budget.department} department'
+        message = (f'{scope} {budget.category or "total"} budget of ${budget.amount} for {period_start.strftime("%B %Y")} '
+                   f'would be exceeded (${remaining} remaining)')
+
+        charge = BudgetPeriod.query.filter(BudgetPeriod.id == period.id)
+        if budget.is_hard:
+            charge = charge.filter(BudgetPeriod.committed + BudgetPeriod.spent + amount <= budget.amount)
+        if charge.update({'committed': BudgetPeriod.committed + amount}, synchronize_session=False) == 0:
+            return {'within_budget': False, 'message': message, 'warnings': [], 'period_ids': []}
+        if amount > remaining:
+            result['warnings'].append(message)
+        result['period_ids'].append(period.id)
+    return result
+
+def settle_budgets(expense, approved):
+    for period_id in json.loads(expense.budget_periods or '[]'):
+        values = {'committed': BudgetPeriod.committed - expense.amount}
+        if approved:
+            values['spent'] = BudgetPeriod.spent + expense.amount
+        BudgetPeriod.query.filter(BudgetPeriod.id == period_id).update(values, synchronize_session=False)
+
+def receipt_path(sha256, *parts):
+    return os.path.join(app.config['RECEIPT_STORAGE_DIR'], *parts, sha256[:2], sha256)
+
+# Stream an upload to disk, hashing as we go; returns (sha256, size)
+def store_receipt(stream):
+    tmp_dir = os.path.join(app.config['RECEIPT_STORAGE_DIR'], 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    max_bytes = app.config['RECEIPT_MAX_BYTES']
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(RECEIPT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f'Receipt exceeds the {max_bytes} byte limit')
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise ValueError('Receipt file is empty')
+
+        sha256 = digest.hexdigest()
+        path = receipt_path(sha256)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return sha256, size
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def render_thumbnail(sha256, size):
+    path = receipt_path(sha256, 'thumbnails') + f'_{size}.jpg'
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as out, Image.open(receipt_path(sha256)) as image:
+            image.thumbnail((size, size))
+            image.convert('RGB').save(out, 'JPEG', quality=80)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return path
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'success': False, 'error': f"Request body exceeds the {app.config['MAX_CONTENT_LENGTH']} byte limit"}), 413
+
+@app.before_request
+def resolve_tenant():
+    company_id = request.headers.get('X-Company-Id') or request.args.get('company_id')
+    try:
+        g.company_id = int(company_id) if company_id else DEFAULT_COMPANY_ID
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid company id'}), 400
+
+# Pin a client to the primary for a short window after it writes
+@app.after_request
+def remember_writes(response):
+    window = app.config['READ_YOUR_WRITES_SECONDS']
+    if app.config['READ_REPLICA_KEYS'] and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        key = _writer_key()
+        if key is not None:
+            now = time.monotonic()
+            with _routing_lock:
+                if len(_recent_writers) > 10000:
+                    for stale in [k for k, until in _recent_writers.items() if until <= now]:
+                        del _recent_writers[stale]
+                _recent_writers[key] = now + window
+        response.set_cookie('rw_sticky', '1', max_age=int(window) or 1, samesite='Lax')
+    return response
 
 # Enhanced Routes
 @app.route('/api/auth/login', methods=['POST'])
@@ -443,7 +1401,14 @@ def create_expense():
             return jsonify({'success': False, 'error': 'User not found'}), 404
 
         # Check policy compliance
-        compliance = check_policy_compliance(Decimal(str(data['amount'])), data.get('category', 'Other'))
+        expense_date = datetime.strptime(data.get('date'), '%Y-%m-%d').date() if data.get('date') else datetime.utcnow().date()
+        compliance = check_policy_compliance(
+            Decimal(str(data['amount'])),
+            data.get('category', 'Other'),
+            user=user,
+            currency=data.get('currency', 'USD'),
+            on_date=expense_date
+        )
         if not compliance['compliant']:
             return jsonify({'success': False, 'error': compliance['message']}), 400
 
@@ -454,35 +1419,38 @@ def create_expense():
             amount=Decimal(str(data['amount'])),
             currency=data.get('currency', 'USD'),
             category=data.get('category', 'Other'),
-            date=datetime.strptime(data.get('date'), '%Y-%m-%d').date() if data.get('date') else datetime.utcnow().date(),
+            date=expense_date,
             status='Pending',
             tags=json.dumps(data.get('tags', []))
         )
+
+        duplicate = find_duplicate_expense(expense_fingerprint(expense.user_id, expense.amount, expense.currency, expense.date, expense.title))
+        duplicate_warning = ''
+        if duplicate:
+            expense.duplicate_of_id = duplicate.id
+            duplicate_warning = f'Possible duplicate of expense #{duplicate.id} "{duplicate.title}" submitted {duplicate.submitted_at.date().isoformat()}'
+
+        budget = reserve_budgets(user, expense.category, expense.amount, expense.date)
+        if not budget['within_budget']:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': budget['message']}), 400
+        expense.budget_periods = json.dumps(budget['period_ids'])
         db.session.add(expense)
         db.session.flush()
 
-        # Create dual approval steps with due dates
-        approvers = []
-        if user.manager:
-            step1 = ApprovalStep(
+        # Create approval steps with due dates; the matching policy decides how many
+        approvers = build_approval_chain(user, compliance['approval_levels'])
+        policy_message = compliance['message']
+        if len(approvers) < compliance['approval_levels']:
+            policy_message = (f"Policy asks for {compliance['approval_levels']} approval levels, "
+                              f"but only {len(approvers)} approvers are available")
+        for sequence, approver in enumerate(approvers, start=1):
+            db.session.add(ApprovalStep(
                 expense_id=expense.id,
-                approver_id=user.manager.id,
-                sequence=1,
-                due_date=datetime.utcnow() + timedelta(days=3)
-            )
-            db.session.add(step1)
-            approvers.append(user.manager)
-
-        admin = User.query.filter_by(role='Admin').first()
-        if admin:
-            step2 = ApprovalStep(
-                expense_id=expense.id,
-                approver_id=admin.id,
-                sequence=2,
-                due_date=datetime.utcnow() + timedelta(days=5)
-            )
-            db.session.add(step2)
-            approvers.append(admin)
+                approver_id=approver.id,
+                sequence=sequence,
+                due_date=datetime.utcnow() + timedelta(days=1 + 2 * sequence)
+            ))
 
         # Create notifications for approvers
         for approver in approvers:
@@ -507,7 +1475,11 @@ def create_expense():
         return jsonify({
             'success': True, 
             'expense': expense.to_dict(include_steps=True),
-            'policy_message': compliance['message']
+            'policy_message': policy_message,
+            'approval_levels': len(approvers),
+            'receipt_required': compliance['requires_receipt'],
+            'duplicate_warning': duplicate_warning,
+            'budget_warnings': budget['warnings']
         }), 201
         
     except Exception as e:
@@ -516,17 +1488,22 @@ def create_expense():
 
 @app.route('/api/expenses/<int:expense_id>/comments', methods=['POST'])
 def add_comment(expense_id):
-    data = request.get_json()
+    return retry_on_conflict(save_comment, expense_id, request.get_json())
+
+def save_comment(expense_id, data):
+    expense = Expense.query.get(expense_id)
+    if not expense:
+        return jsonify({'success': False, 'error': 'Expense not found'}), 404
+
     comment = Comment(
         expense_id=expense_id,
         user_id=data['user_id'],
         content=data['content']
     )
     db.session.add(comment)
-    db.session.commit()
+    touch_expense(expense)
     
     # Notify relevant users
-    expense = Expense.query.get(expense_id)
     create_notification(
         expense.user_id,
         'New Comment',
@@ -534,10 +1511,99 @@ def add_comment(expense_id):
         'info',
         expense_id
     )
+    db.session.commit()
     
     return jsonify({'success': True, 'comment': comment.to_dict()})
 
+@app.route('/api/expenses/<int:expense_id>/receipt', methods=['POST'])
+def upload_receipt(expense_id):
+    expense = Expense.query.get(expense_id)
+    if not expense:
+        return jsonify({'success': False, 'error': 'Expense not found'}), 404
+
+    # Accept either a multipart form field or the raw file as the request body
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'success': False, 'error': 'No file provided'}), 400
+        stream, content_type = upload.stream, upload.mimetype
+    else:
+        stream, content_type = request.stream, request.mimetype
+
+    if content_type not in RECEIPT_CONTENT_TYPES:
+        return jsonify({'success': False, 'error': f'Unsupported receipt type: {content_type or "unknown"}'}), 415
+
+    try:
+        sha256, size = store_receipt(stream)
+    except ValueError as e:
+        status = 413 if 'limit' in str(e) else 400
+        return jsonify({'success': False, 'error': str(e)}), status
+
+    try:
+        return retry_on_conflict(attach_receipt, expense_id, sha256, content_type, size)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def attach_receipt(expense_id, sha256, content_type, size):
+    expense = Expense.query.get(expense_id)
+    if not expense:
+        return jsonify({'success': False, 'error': 'Expense not found'}), 404
+
+    receipt = Receipt.query.filter_by(sha256=sha256).first()
+    if not receipt:
+        try:
+            with db.session.begin_nested():
+                receipt = Receipt(sha256=sha256, content_type=content_type, size=size)
+                db.session.add(receipt)
+        except IntegrityError:
+            # The same file was uploaded by a concurrent request
+            receipt = Receipt.query.filter_by(sha256=sha256).one()
+    expense.receipt_url = receipt.url
+    touch_expense(expense)
+    db.session.commit()
+
+    return jsonify({'success': True, 'receipt': receipt.to_dict(), 'expense': expense.to_dict()}), 201
+
+@app.route('/api/receipts/<sha256>', methods=['GET'])
+@read_only
+def download_receipt(sha256):
+    receipt = Receipt.query.filter_by(sha256=sha256).first() if SHA256_PATTERN.fullmatch(sha256) else None
+    if not receipt or not os.path.exists(receipt_path(sha256)):
+        return jsonify({'success': False, 'error': 'Receipt not found'}), 404
+
+    # conditional=True answers Range and If-None-Match requests; content never changes for a hash
+    return private_file(send_file(receipt_path(sha256), mimetype=receipt.content_type, conditional=True,
+                                  etag=sha256, max_age=31536000))
+
+@app.route('/api/receipts/<sha256>/thumbnail', methods=['GET'])
+@read_only
+def receipt_thumbnail(sha256):
+    size = request.args.get('size', 256, type=int)
+    if size not in RECEIPT_THUMBNAIL_SIZES:
+        return jsonify({'success': False, 'error': f'Size must be one of {list(RECEIPT_THUMBNAIL_SIZES)}'}), 400
+
+    receipt = Receipt.query.filter_by(sha256=sha256).first() if SHA256_PATTERN.fullmatch(sha256) else None
+    if not receipt or not os.path.exists(receipt_path(sha256)):
+        return jsonify({'success': False, 'error': 'Receipt not found'}), 404
+    if not receipt.content_type.startswith('image/'):
+        return jsonify({'success': False, 'error': 'Thumbnails are only available for image receipts'}), 415
+
+    try:
+        path = render_thumbnail(sha256, size)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return jsonify({'success': False, 'error': 'Receipt image could not be read'}), 422
+
+    return private_file(send_file(path, mimetype='image/jpeg', conditional=True, etag=f'{sha256}-{size}', max_age=31536000))
+
+def private_file(response):
+    # The URL doesn't name the company, so shared caches must not serve it to another tenant
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @app.route('/api/notifications/<int:user_id>', methods=['GET'])
+@read_only
 def get_notifications(user_id):
     notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.created_at.desc()).limit(20).all()
     return jsonify({'success': True, 'notifications': [n.to_dict() for n in notifications]})
@@ -551,6 +1617,7 @@ def mark_notification_read(notification_id):
     return jsonify({'success': True})
 
 @app.route('/api/dashboard/stats', methods=['GET'])
+@read_only
 def get_dashboard_stats():
     total_expenses = Expense.query.count()
     pending_expenses = Expense.query.filter_by(status='Pending').count()
@@ -583,6 +1650,7 @@ def get_dashboard_stats():
     })
 
 @app.route('/api/expenses/search', methods=['GET'])
+@read_only
 def search_expenses():
     query = request.args.get('q', '')
     category = request.args.get('category', '')
@@ -610,19 +1678,23 @@ def search_expenses():
     if date_to:
         expenses_query = expenses_query.filter(Expense.date <= datetime.strptime(date_to, '%Y-%m-%d').date())
     
-    expenses = expenses_query.order_by(Expense.submitted_at.desc()).all()
-    return jsonify({'success': True, 'expenses': [exp.to_dict(include_steps=True) for exp in expenses]})
+    return expense_list_response(expenses_query.order_by(Expense.submitted_at.desc()))
 
 # Keep existing routes and add new ones...
 @app.route('/api/approvals/<int:user_id>', methods=['GET'])
+@read_only
 def get_approval_queue(user_id):
-    steps = ApprovalStep.query.filter_by(approver_id=user_id, status='Waiting').all()
-    expenses = [step.expense.to_dict(include_steps=True) for step in steps]
-    return jsonify({'success': True, 'approvals': expenses})
+    expenses_query = Expense.query.join(ApprovalStep, ApprovalStep.expense_id == Expense.id).filter(
+        ApprovalStep.approver_id == user_id,
+        ApprovalStep.status == 'Waiting'
+    ).order_by(ApprovalStep.id)
+    return expense_list_response(expenses_query, key='approvals')
 
 @app.route('/api/approvals/<int:step_id>', methods=['PUT'])
 def process_approval(step_id):
-    data = request.get_json()
+    return retry_on_conflict(decide_approval_step, step_id, request.get_json())
+
+def decide_approval_step(step_id, data):
     step = ApprovalStep.query.get(step_id)
     
     if not step:
@@ -637,10 +1709,15 @@ def process_approval(step_id):
     step.decided_at = datetime.utcnow()
     
     expense = step.expense
+    touch_expense(expense)
     
     if step.status == 'Rejected':
         expense.status = 'Rejected'
-        ApprovalStep.query.filter_by(expense_id=expense.id, status='Waiting').update({'status': 'Skipped'})
+        settle_budgets(expense, approved=False)
+        # Update through the ORM (not a bulk UPDATE) so the change feed sees each step
+        for sibling in expense.approval_steps:
+            if sibling.status == 'Waiting':
+                sibling.status = 'Skipped'
         
         # Notify submitter
         create_notification(
@@ -654,6 +1731,7 @@ def process_approval(step_id):
         pending = ApprovalStep.query.filter_by(expense_id=expense.id, status='Waiting').count()
         if pending == 0:
             expense.status = 'Approved'
+            settle_budgets(expense, approved=True)
             create_notification(
                 expense.user_id,
                 'Expense Approved',
@@ -666,32 +1744,234 @@ def process_approval(step_id):
     return jsonify({'success': True, 'expense': expense.to_dict(include_steps=True)})
 
 @app.route('/api/expenses/history/<int:user_id>', methods=['GET'])
+@read_only
 def get_expense_history(user_id):
-    expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.submitted_at.desc()).all()
-    return jsonify({'success': True, 'expenses': [exp.to_dict(include_steps=True) for exp in expenses]})
+    return expense_list_response(Expense.query.filter_by(user_id=user_id).order_by(Expense.submitted_at.desc()))
 
 @app.route('/api/expenses/all', methods=['GET'])
+@read_only
 def get_all_expenses():
-    expenses = Expense.query.order_by(Expense.submitted_at.desc()).all()
-    return jsonify({'success': True, 'expenses': [exp.to_dict(include_steps=True) for exp in expenses]})
+    return expense_list_response(Expense.query.order_by(Expense.submitted_at.desc()))
 
 @app.route('/api/expenses/team/<int:manager_id>', methods=['GET'])
+@read_only
 def get_team_expenses(manager_id):
     team_members = User.query.filter_by(manager_id=manager_id).all()
     member_ids = [member.id for member in team_members]
-    expenses = Expense.query.filter(Expense.user_id.in_(member_ids)).order_by(Expense.submitted_at.desc()).all()
-    return jsonify({'success': True, 'expenses': [exp.to_dict(include_steps=True) for exp in expenses]})
+    return expense_list_response(Expense.query.filter(Expense.user_id.in_(member_ids)).order_by(Expense.submitted_at.desc()))
+
+@app.route('/api/audit/duplicates', methods=['GET'])
+@read_only
+def audit_duplicates():
+    days = request.args.get('days', 3, type=int)
+    similarity = request.args.get('similarity', 0.8, type=float)
+    try:
+        date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() if request.args.get('date_to') else datetime.utcnow().date()
+        date_from = (datetime.strptime(request.args['date_from'], '%Y-%m-%d').date() if request.args.get('date_from')
+                     else date_to - timedelta(days=DUPLICATE_AUDIT_DAYS))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'date_from and date_to must be YYYY-MM-DD'}), 400
+
+    expenses_query = Expense.query.options(
+        load_only(Expense.id, Expense.user_id, Expense.title, Expense.amount, Expense.currency, Expense.date)
+    ).filter(
+        Expense.status != 'Rejected',
+        Expense.date >= date_from,
+        Expense.date <= date_to
+    ).order_by(Expense.user_id, Expense.currency, Expense.amount, Expense.date, Expense.id)
+
+    matches = find_near_duplicates(expenses_query.yield_per(500), max_days_apart=days, min_similarity=similarity)
+    return jsonify({'success': True, 'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(), 'duplicates': matches})
+
+# Clients pass the returned cursor as since and keep paging while has_more; notifications only for user_id
+@app.route('/api/changes', methods=['GET'])
+@read_only
+def get_changes():
+    since = request.args.get('since', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+    user_id = request.args.get('user_id', type=int)
+
+    # Rows without a sequence belong to transactions that haven't committed yet
+    changes_query = ChangeLog.query.filter(ChangeLog.seq > since)
+    if user_id:
+        changes_query = changes_query.filter(or_(ChangeLog.table_name != Notification.__tablename__, ChangeLog.owner_id == user_id))
+    else:
+        changes_query = changes_query.filter(ChangeLog.table_name != Notification.__tablename__)
+    entries = changes_query.order_by(ChangeLog.seq).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Only the latest operation per row matters
+    latest = {}
+    for entry in entries:
+        latest[(SYNCED_TABLES[entry.table_name], entry.row_id)] = entry.operation
+
+    changed = {name: [] for name in SYNCED_MODELS}
+    deleted = []
+    for name, model in SYNCED_MODELS.items():
+        ids = [row_id for (table, row_id), operation in latest.items() if table == name and operation == 'upsert']
+        rows = model.query.filter(model.id.in_(ids)).all() if ids else []
+        for row in rows:
+            changed[name].append(row.to_dict(include_steps=True) if model is Expense else row.to_dict())
+        found = {row.id for row in rows}
+        deleted.extend({'type': name, 'id': row_id} for (table, row_id), operation in latest.items()
+                       if table == name and (operation == 'delete' or row_id not in found))
+
+    return jsonify({
+        'success': True,
+        'cursor': entries[-1].seq if entries else since,
+        'has_more': has_more,
+        'changes': changed,
+        'deleted': deleted
+    })
 
 @app.route('/api/users', methods=['GET'])
+@read_only
 def get_users():
     users = User.query.filter_by(is_active=True).all()
     return jsonify({'success': True, 'users': [user.to_dict() for user in users]})
 
 @app.route('/api/policies', methods=['GET'])
+@read_only
 def get_policies():
     policies = Policy.query.all()
     return jsonify({'success': True, 'policies': [policy.to_dict() for policy in policies]})
 
+@app.route('/api/policies', methods=['POST'])
+def create_policy():
+    data = request.get_json()
+
+    try:
+        approval_levels = int(data.get('approval_levels', DEFAULT_APPROVAL_LEVELS))
+        if approval_levels < 1:
+            raise ValueError('approval_levels must be at least 1')
+        policy = Policy(
+            category=data['category'],
+            max_amount=Decimal(str(data['max_amount'])),
+            requires_receipt=data.get('requires_receipt', True),
+            approval_threshold=Decimal(str(data['approval_threshold'])) if data.get('approval_threshold') is not None else None,
+            approval_levels=approval_levels,
+            department=data.get('department') or None,
+            role=data.get('role') or None,
+            currency=data.get('currency') or None,
+            valid_from=datetime.strptime(data['valid_from'], '%Y-%m-%d').date() if data.get('valid_from') else None,
+            valid_to=datetime.strptime(data['valid_to'], '%Y-%m-%d').date() if data.get('valid_to') else None
+        )
+        db.session.add(policy)
+        db.session.commit()
+    except (KeyError, ValueError, ArithmeticError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Invalid policy: {e}'}), 400
+
+    invalidate_policy_engine()
+    return jsonify({'success': True, 'policy': policy.to_dict()}), 201
+
+@app.route('/api/policies/evaluate', methods=['POST'])
+def evaluate_policies():
+    items = (request.get_json(silent=True) or {}).get('expenses', [])
+    if not isinstance(items, list):
+        return jsonify({'success': False, 'error': 'expenses must be a list'}), 400
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('category') or item.get('amount') is None:
+            return jsonify({'success': False, 'error': f'Expense {index} needs a category and an amount'}), 400
+        try:
+            Decimal(str(item['amount']))
+            if item.get('date'):
+                item['date'] = datetime.strptime(item['date'], '%Y-%m-%d').date()
+        except (ValueError, TypeError, ArithmeticError):
+            return jsonify({'success': False, 'error': f'Expense {index} has an invalid amount or date'}), 400
+
+    return jsonify({'success': True, 'decisions': get_policy_engine().evaluate_batch(items)})
+
+@app.route('/api/companies', methods=['POST'])
+def create_company():
+    data = request.get_json()
+    admin_data = data.get('admin') or {}
+    if not data.get('name') or not admin_data.get('email') or not admin_data.get('password'):
+        return jsonify({'success': False, 'error': 'Company name and admin email/password are required'}), 400
+
+    company = Company(name=data['name'], base_currency=data.get('base_currency', 'USD'))
+    db.session.add(company)
+    db.session.commit()
+    mirror_company(company.id)
+
+    with tenant_context(company.id):
+        admin = User(
+            email=admin_data['email'],
+            password=admin_data['password'],
+            name=admin_data.get('name', 'Administrator'),
+            role='Admin',
+            department=admin_data.get('department', 'General')
+        )
+        db.session.add(admin)
+        try:
+            ensure_change_sequence(company.id)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'A user with that email already exists in this company'}), 409
+        return jsonify({'success': True, 'company': company.to_dict(), 'admin': admin.to_dict()}), 201
+
+@app.route('/api/metrics/cache', methods=['GET'])
+def get_cache_metrics():
+    return jsonify({'success': True, 'expense_cache': expense_cache.stats()})
+
+@app.route('/api/budgets', methods=['POST'])
+def create_budget():
+    data = request.get_json()
+    if bool(data.get('user_id')) == bool(data.get('department')):
+        return jsonify({'success': False, 'error': 'A budget needs either a user_id or a department'}), 400
+    user_id = data.get('user_id')
+    if user_id and (not isinstance(user_id, int) or isinstance(user_id, bool) or not User.query.filter_by(id=user_id).first()):
+        return jsonify({'success': False, 'error': 'user_id must name a user in this company'}), 400
+
+    try:
+        budget = Budget(
+            user_id=data.get('user_id'),
+            department=data.get('department'),
+            category=data.get('category') or None,
+            amount=Decimal(str(data['amount'])),
+            is_hard=data.get('is_hard', True)
+        )
+        db.session.add(budget)
+        db.session.commit()
+    except (KeyError, ArithmeticError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Invalid budget: {e}'}), 400
+
+    return jsonify({'success': True, 'budget': budget.to_dict()}), 201
+
+@app.route('/api/budgets/remaining', methods=['GET'])
+@read_only
+def get_remaining_budget():
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None:
+        return jsonify({'success': False, 'error': 'user_id must be an integer'}), 400
+    month = request.args.get('month', '')
+    try:
+        period_start = datetime.strptime(month, '%Y-%m').date() if month else datetime.utcnow().date().replace(day=1)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'month must be YYYY-MM'}), 400
+
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({'success': False, 'error': 'User not found'}), 404
+
+    budgets = applicable_budgets(user, request.args.get('category') or None)
+    periods = {}
+    if budgets:
+        periods = {p.budget_id: p for p in BudgetPeriod.query.filter(
+            BudgetPeriod.budget_id.in_([b.id for b in budgets]),
+            BudgetPeriod.period_start == period_start
+        )}
+
+    return jsonify({
+        'success': True,
+        'period': period_start.strftime('%Y-%m'),
+        'budgets': [budget.to_dict(periods.get(budget.id)) for budget in budgets]
+    })
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'API is running'})
@@ -705,6 +1985,19 @@ def serve_frontend(path):
         return send_from_directory('static', 'index.html')
     return send_from_directory('static', path)
 
+@app.cli.command('upgrade-db', help='Bring existing databases up to date with the models (once per deploy, before the workers start).')
+def upgrade_db_command():
+    for engine in schema_engines():
+        upgrade_schema(engine)
+    backfill_fingerprints()
+    backfill_change_sequence()
+    for company_id in app.config['TENANT_BINDS']:
+        with tenant_context(company_id):
+            backfill_fingerprints()
+            backfill_change_sequence()
+    init_db()
+    print("Database schema is up to date")
+
 # Initialize database on startup
 try:
     init_db()
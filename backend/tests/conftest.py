@@ -0,0 +1,53 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix='expense-manager-tests-')
+PRIMARY_PATH = os.path.join(DATA_DIR, 'primary.db')
+REPLICA_PATHS = [os.path.join(DATA_DIR, 'replica_a.db'), os.path.join(DATA_DIR, 'replica_b.db')]
+MISSING_REPLICA_PATH = os.path.join(DATA_DIR, 'missing', 'replica.db')
+
+# app.py reads its configuration at import time, so point it at throwaway files first.
+# The replicas are configured but switched off below; test_replicas turns them on.
+os.environ['DATABASE_URL'] = f'sqlite:///{PRIMARY_PATH}'
+os.environ['DATABASE_REPLICA_URLS'] = ','.join(f'sqlite:///{path}' for path in REPLICA_PATHS + [MISSING_REPLICA_PATH])
+os.environ['RECEIPT_STORAGE_DIR'] = os.path.join(DATA_DIR, 'receipts')
+sys.path.insert(0, BACKEND_DIR)
+
+import app as expense_app  # noqa: E402
+from app import User, db, tenant_context  # noqa: E402
+
+REPLICA_KEYS = list(expense_app.app.config['READ_REPLICA_KEYS'])
+expense_app.app.config['READ_REPLICA_KEYS'] = []
+
+@pytest.fixture
+def client():
+    return expense_app.app.test_client()
+
+_companies = itertools.count()
+
+@pytest.fixture
+def company(client):
+    """A fresh company with an admin, a manager reporting to them and an employee under the manager."""
+    response = client.post('/api/companies', json={
+        'name': f'Test Company {next(_companies)}', 'admin': {'email': 'admin@company.test', 'password': 'secret'}
+    })
+    assert response.status_code == 201, response.get_json()
+    company_id = response.get_json()['company']['id']
+    admin_id = response.get_json()['admin']['id']
+
+    with expense_app.app.app_context(), tenant_context(company_id):
+        manager = User(email='manager@company.test', password='secret', name='Manager', role='Manager',
+                       department='Sales', manager_id=admin_id)
+        db.session.add(manager)
+        db.session.flush()
+        employee = User(email='employee@company.test', password='secret', name='Employee', role='Employee',
+                        department='Sales', manager_id=manager.id)
+        db.session.add(employee)
+        db.session.commit()
+        ids = {'company': company_id, 'admin': admin_id, 'manager': manager.id, 'employee': employee.id}
+    return ids, {'X-Company-Id': str(company_id)}
@@ -0,0 +1,86 @@
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import app as expense_app
+from app import Expense, db, tenant_context
+
+EXPENSES = 20
+REQUESTS_PER_STEP = 3  # Every approver double- (and triple-) clicks
+WORKERS = 16
+MIN_REQUESTS_PER_SECOND = 10  # Loose bound; the suite does ~100/s on a laptop
+
+def submit_expenses(client, count, prefix):
+    """Expenses for employee 4, each waiting on their manager and the admin."""
+    steps = {}
+    for n in range(count):
+        response = client.post('/api/expenses', json={
+            'user_id': 4, 'title': f'{prefix} {n}', 'amount': 20 + n, 'category': 'Other', 'date': '2026-02-01'
+        })
+        assert response.status_code == 201, response.get_json()
+        expense = response.get_json()['expense']
+        steps[expense['id']] = [step['id'] for step in expense['approval_steps']]
+        assert len(steps[expense['id']]) == 2
+    return steps
+
+def run_concurrently(requests):
+    """Send (method, url, options) requests from a thread pool; returns status codes and elapsed seconds."""
+    def send(request):
+        method, url, options = request
+        return getattr(expense_app.app.test_client(), method)(url, **options).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        codes = list(pool.map(send, requests))
+    return codes, time.perf_counter() - started
+
+def expense_statuses(expense_ids):
+    with expense_app.app.app_context(), tenant_context(expense_app.DEFAULT_COMPANY_ID):
+        return {
+            expense.id: (expense.status, [step.status for step in expense.approval_steps])
+            for expense in Expense.query.filter(Expense.id.in_(expense_ids))
+        }
+
+def test_concurrent_approvals_decide_each_step_once(client):
+    steps = submit_expenses(client, EXPENSES, 'Concurrent approval')
+    requests = [
+        ('put', f'/api/approvals/{step_id}', {'json': {'decision': 'approved'}})
+        for step_ids in steps.values() for step_id in step_ids for _ in range(REQUESTS_PER_STEP)
+    ]
+    random.Random(33).shuffle(requests)
+    assert len(requests) == 120
+
+    codes, elapsed = run_concurrently(requests)
+
+    # One request per step wins; the repeats see the step already processed
+    assert Counter(codes) == {200: 40, 400: 80}
+    for status, step_statuses in expense_statuses(steps).values():
+        assert status == 'Approved'
+        assert step_statuses == ['Approved', 'Approved']
+    assert len(requests) / elapsed >= MIN_REQUESTS_PER_SECOND
+
+def test_comments_and_receipts_racing_approvals_do_not_fail(client):
+    steps = submit_expenses(client, EXPENSES // 2, 'Concurrent comment')
+    requests = []
+    for expense_id, step_ids in steps.items():
+        requests += [('put', f'/api/approvals/{step_id}', {'json': {'decision': 'approved'}}) for step_id in step_ids]
+        requests += [
+            ('post', f'/api/expenses/{expense_id}/comments', {'json': {'user_id': 2, 'content': f'Looks fine ({n})'}})
+            for n in range(REQUESTS_PER_STEP)
+        ]
+        # The same file each time, so uploads also race to create the shared Receipt row
+        requests += [
+            ('post', f'/api/expenses/{expense_id}/receipt', {'data': b'%PDF-1.4 shared receipt', 'content_type': 'application/pdf'})
+        ] * REQUESTS_PER_STEP
+    random.Random(33).shuffle(requests)
+
+    codes, _ = run_concurrently(requests)
+
+    assert Counter(codes) == {200: len(steps) * (2 + REQUESTS_PER_STEP), 201: len(steps) * REQUESTS_PER_STEP}
+    for status, step_statuses in expense_statuses(steps).values():
+        assert status == 'Approved'
+    with expense_app.app.app_context(), tenant_context(expense_app.DEFAULT_COMPANY_ID):
+        for expense in Expense.query.filter(Expense.id.in_(steps)):
+            assert len(expense.comments) == REQUESTS_PER_STEP
+            assert expense.receipt_url
@@ -0,0 +1,88 @@
+import pytest
+
+@pytest.mark.parametrize('query', ['month=2026-01', 'user_id=abc', 'user_id=4&month=January', 'user_id=4&month=2026-13'])
+def test_remaining_budget_rejects_bad_input(client, query):
+    response = client.get(f'/api/budgets/remaining?{query}')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+def test_remaining_budget_for_month(client):
+    assert client.get('/api/budgets/remaining?user_id=999').status_code == 404
+
+    response = client.get('/api/budgets/remaining?user_id=4&month=2026-01')
+    assert response.status_code == 200
+    assert response.get_json()['period'] == '2026-01'
+
+def submit(client, headers, user_id, amount):
+    return client.post('/api/expenses', headers=headers, json={
+        'user_id': user_id, 'title': f'Budget check {amount}', 'amount': amount, 'category': 'Other', 'date': '2026-06-15'
+    })
+
+def create_budget(client, headers, **budget):
+    response = client.post('/api/budgets', headers=headers, json=budget)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['budget']['id']
+
+def budget_totals(client, headers, user_id, budget_id):
+    response = client.get(f'/api/budgets/remaining?user_id={user_id}&month=2026-06', headers=headers)
+    assert response.status_code == 200
+    return next(budget for budget in response.get_json()['budgets'] if budget['id'] == budget_id)
+
+def decide(client, headers, expense, decision):
+    for step in expense['approval_steps']:
+        response = client.put(f"/api/approvals/{step['id']}", headers=headers, json={'decision': decision})
+        assert response.status_code == 200
+        if decision == 'rejected':
+            break
+
+def test_hard_budget_blocks_submissions_over_the_limit(client, company):
+    ids, headers = company
+    budget_id = create_budget(client, headers, user_id=ids['employee'], amount=100, is_hard=True)
+
+    assert submit(client, headers, ids['employee'], 60).status_code == 201
+    over = submit(client, headers, ids['employee'], 50)
+    assert over.status_code == 400
+    assert over.get_json()['success'] is False
+
+    totals = budget_totals(client, headers, ids['employee'], budget_id)
+    assert (totals['committed'], totals['spent'], totals['remaining']) == (60, 0, 40)
+
+def test_soft_budget_only_warns(client, company):
+    ids, headers = company
+    budget_id = create_budget(client, headers, department='Sales', amount=100, is_hard=False)
+
+    response = submit(client, headers, ids['employee'], 150)
+    assert response.status_code == 201
+    assert response.get_json()['budget_warnings']
+    assert budget_totals(client, headers, ids['employee'], budget_id)['remaining'] == -50
+
+def test_approval_moves_committed_to_spent(client, company):
+    ids, headers = company
+    budget_id = create_budget(client, headers, user_id=ids['employee'], amount=100)
+    expense = submit(client, headers, ids['employee'], 70).get_json()['expense']
+
+    decide(client, headers, expense, 'approved')
+    totals = budget_totals(client, headers, ids['employee'], budget_id)
+    assert (totals['committed'], totals['spent'], totals['remaining']) == (0, 70, 30)
+
+def test_rejection_releases_the_reservation(client, company):
+    ids, headers = company
+    budget_id = create_budget(client, headers, user_id=ids['employee'], amount=100)
+    expense = submit(client, headers, ids['employee'], 70).get_json()['expense']
+
+    decide(client, headers, expense, 'rejected')
+    totals = budget_totals(client, headers, ids['employee'], budget_id)
+    assert (totals['committed'], totals['spent'], totals['remaining']) == (0, 0, 100)
+    assert submit(client, headers, ids['employee'], 90).status_code == 201
+
+@pytest.mark.parametrize('user_id', ['4', True, 999999])
+def test_budget_user_must_belong_to_the_company(client, company, user_id):
+    _, headers = company
+    response = client.post('/api/budgets', headers=headers, json={'user_id': user_id, 'amount': 100})
+    assert response.status_code == 400
+
+def test_budget_rejects_another_companys_user(client, company):
+    _, headers = company
+    # User 4 belongs to the default company
+    response = client.post('/api/budgets', headers=headers, json={'user_id': 4, 'amount': 100})
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+import app as expense_app
+from app import ChangeLog, assign_change_sequence, db, tenant_context
+
+def poll(client, since):
+    response = client.get(f'/api/changes?since={since}&user_id=1')
+    assert response.status_code == 200
+    return response.get_json()
+
+def create_expense(client, title):
+    response = client.post('/api/expenses', json={
+        'user_id': 4, 'title': title, 'amount': 12.5, 'category': 'Other', 'date': '2026-01-15'
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['expense']['id']
+
+def test_feed_returns_new_changes_after_cursor(client):
+    cursor = poll(client, 0)['cursor']
+    expense_id = create_expense(client, 'Change feed taxi')
+
+    feed = poll(client, cursor)
+    assert expense_id in [expense['id'] for expense in feed['changes']['expenses']]
+    assert feed['cursor'] > cursor
+    assert poll(client, feed['cursor'])['changes']['expenses'] == []
+
+def test_change_committed_late_is_not_skipped(client):
+    cursor = poll(client, 0)['cursor']
+    late_id = create_expense(client, 'Change feed late writer')
+
+    # A change whose transaction hasn't committed yet: its row exists (the insert took an id)
+    # but no sequence has been handed out. Meanwhile another writer commits.
+    with expense_app.app.app_context(), tenant_context(expense_app.DEFAULT_COMPANY_ID):
+        connection = db.session.connection(bind_arguments={'mapper': ChangeLog})
+        in_flight = connection.execute(ChangeLog.__table__.insert().values(
+            company_id=expense_app.DEFAULT_COMPANY_ID, table_name=expense_app.Expense.__tablename__, row_id=late_id, operation='upsert'
+        )).inserted_primary_key[0]
+        db.session.commit()
+    create_expense(client, 'Change feed early writer')
+
+    feed = poll(client, cursor)
+    assert late_id in [expense['id'] for expense in feed['changes']['expenses']]
+    cursor = feed['cursor']
+    assert poll(client, cursor)['changes']['expenses'] == []
+
+    # The slow transaction commits now, after the client has moved its cursor past the
+    # early writer. It must still sort after that cursor.
+    with expense_app.app.app_context(), tenant_context(expense_app.DEFAULT_COMPANY_ID):
+        assign_change_sequence(db.session.connection(bind_arguments={'mapper': ChangeLog}),
+                               expense_app.DEFAULT_COMPANY_ID, {in_flight})
+        db.session.commit()
+        assert db.session.get(ChangeLog, in_flight).seq > cursor
+
+    feed = poll(client, cursor)
+    assert [expense['id'] for expense in feed['changes']['expenses']] == [late_id]
+
+def test_limit_below_one_still_makes_progress(client):
+    create_expense(client, 'Change feed paging')
+    for limit in (0, -1):
+        feed = client.get(f'/api/changes?since=0&limit={limit}&user_id=1').get_json()
+        assert feed['cursor'] > 0
+        assert sum(len(rows) for rows in feed['changes'].values()) + len(feed['deleted']) == 1
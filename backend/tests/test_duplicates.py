@@ -0,0 +1,26 @@
+def submit(client, headers, user_id, title, on_date):
+    response = client.post('/api/expenses', headers=headers, json={
+        'user_id': user_id, 'title': title, 'amount': 42.5, 'category': 'Other', 'date': on_date
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['expense']['id']
+
+def test_audit_finds_near_duplicates_in_window(client, company):
+    ids, headers = company
+    first = submit(client, headers, ids['employee'], 'Taxi to airport', '2026-07-01')
+    second = submit(client, headers, ids['employee'], 'Taxi to the airport', '2026-07-02')
+    submit(client, headers, ids['employee'], 'Taxi to airport', '2026-03-01')
+
+    response = client.get('/api/audit/duplicates?date_from=2026-06-01&date_to=2026-07-31', headers=headers)
+    assert response.status_code == 200
+    pairs = [(match['duplicate_of'], match['expense_id']) for match in response.get_json()['duplicates']]
+    assert pairs == [(first, second)]
+
+def test_audit_defaults_to_recent_window(client, company):
+    _, headers = company
+    body = client.get('/api/audit/duplicates?date_to=2026-07-31', headers=headers).get_json()
+    assert body['date_from'] == '2026-05-02'
+
+def test_audit_rejects_bad_dates(client):
+    for query in ('date_from=July', 'date_to=2026-02-30'):
+        assert client.get(f'/api/audit/duplicates?{query}').status_code == 400
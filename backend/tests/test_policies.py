@@ -0,0 +1,71 @@
+import pytest
+
+import app as expense_app
+from app import User, db, tenant_context
+
+@pytest.fixture
+def org(client, company):
+    """The test company plus one Travel policy."""
+    ids, headers = company
+    response = client.post('/api/policies', headers=headers, json={
+        'category': 'Travel', 'max_amount': 1000, 'approval_threshold': 500, 'requires_receipt': False
+    })
+    assert response.status_code == 201, response.get_json()
+    return ids, headers
+
+def submit(client, headers, user_id, amount, category='Travel'):
+    response = client.post('/api/expenses', headers=headers, json={
+        'user_id': user_id, 'title': f'{category} {amount}', 'amount': amount, 'category': category, 'date': '2026-05-01'
+    })
+    assert response.status_code == 201, response.get_json()
+    body = response.get_json()
+    return body, [step['approver_id'] for step in body['expense']['approval_steps']]
+
+def test_under_threshold_routes_to_manager_and_admin(client, org):
+    ids, headers = org
+    body, approvers = submit(client, headers, ids['employee'], 100)
+    assert approvers == [ids['manager'], ids['admin']]
+    assert body['approval_levels'] == 2
+    assert body['policy_message'] == ''
+
+def test_over_threshold_without_extra_approver_says_so(client, org):
+    ids, headers = org
+    body, approvers = submit(client, headers, ids['employee'], 600)
+    assert approvers == [ids['manager'], ids['admin']]
+    assert body['approval_levels'] == 2
+    assert 'additional approval required' not in body['policy_message']
+    assert 'only 2 approvers' in body['policy_message']
+
+def test_over_threshold_adds_a_second_admin(client, org):
+    ids, headers = org
+    with expense_app.app.app_context(), tenant_context(ids['company']):
+        finance = User(email='finance@routing.test', password='secret', name='Finance', role='Admin')
+        db.session.add(finance)
+        db.session.commit()
+        finance_id = finance.id
+
+    body, approvers = submit(client, headers, ids['employee'], 600)
+    assert approvers == [ids['manager'], ids['admin'], finance_id]
+    assert body['approval_levels'] == 3
+    assert 'additional approval required' in body['policy_message']
+
+    _, approvers = submit(client, headers, ids['employee'], 100)
+    assert approvers == [ids['manager'], ids['admin']]
+
+def test_policy_without_threshold_adds_no_level(client, org):
+    ids, headers = org
+    response = client.post('/api/policies', headers=headers, json={'category': 'Books', 'max_amount': 200})
+    assert response.status_code == 201
+    assert response.get_json()['policy']['approval_threshold'] is None
+
+    body, approvers = submit(client, headers, ids['employee'], 1, category='Books')
+    assert approvers == [ids['manager'], ids['admin']]
+    assert body['policy_message'] == ''
+
+@pytest.mark.parametrize('levels', [0, -1, 'two'])
+def test_policy_needs_at_least_one_level(client, org, levels):
+    _, headers = org
+    response = client.post('/api/policies', headers=headers, json={
+        'category': 'Books', 'max_amount': 200, 'approval_levels': levels
+    })
+    assert response.status_code == 400
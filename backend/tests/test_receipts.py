@@ -0,0 +1,31 @@
+import io
+
+from PIL import Image
+
+import app as expense_app
+
+def png_bytes(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def test_oversized_uploads_are_rejected_before_buffering(client, monkeypatch):
+    monkeypatch.setitem(expense_app.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    body = b'x' * 4096
+
+    multipart = client.post('/api/expenses/1/receipt', content_type='multipart/form-data',
+                            data={'file': (io.BytesIO(body), 'receipt.pdf', 'application/pdf')})
+    assert multipart.status_code == 413
+    assert multipart.get_json()['success'] is False
+
+    raw = client.post('/api/expenses/1/receipt', data=body, content_type='application/pdf')
+    assert raw.status_code == 413
+
+def test_thumbnail_of_decompression_bomb_is_rejected(client, monkeypatch):
+    response = client.post('/api/expenses/1/receipt', data=png_bytes((64, 64)), content_type='image/png')
+    assert response.status_code == 201
+    url = response.get_json()['receipt']['thumbnail_url']
+
+    # Pillow refuses images over twice this many pixels
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    assert client.get(f'{url}?size=128').status_code == 422
@@ -0,0 +1,69 @@
+import itertools
+import shutil
+import sqlite3
+
+import pytest
+
+import app as expense_app
+from conftest import PRIMARY_PATH, REPLICA_KEYS, REPLICA_PATHS
+
+# Each replica renames the admin so responses show which database served them
+REPLICA_NAMES = ['Replica A', 'Replica B']
+
+@pytest.fixture
+def replicas(monkeypatch):
+    for path, name in zip(REPLICA_PATHS, REPLICA_NAMES):
+        shutil.copyfile(PRIMARY_PATH, path)
+        with sqlite3.connect(path) as connection:
+            connection.execute('UPDATE user SET name = ? WHERE id = 1', (name,))
+    with expense_app.app.app_context():
+        # Drop pooled connections that still point at the previous copies
+        for key in REPLICA_KEYS:
+            expense_app.db.engines[key].dispose()
+
+    monkeypatch.setitem(expense_app.app.config, 'READ_REPLICA_KEYS', REPLICA_KEYS[:len(REPLICA_PATHS)])
+    monkeypatch.setattr(expense_app, '_replica_cycle', itertools.count())
+    monkeypatch.setattr(expense_app, '_replica_down_until', {})
+    monkeypatch.setattr(expense_app, '_recent_writers', {})
+
+def admin_name(client):
+    response = client.get('/api/users')
+    assert response.status_code == 200
+    return next(user['name'] for user in response.get_json()['users'] if user['id'] == 1)
+
+def expense_ids(client, user_id):
+    response = client.get(f'/api/expenses/history/{user_id}')
+    assert response.status_code == 200
+    return [expense['id'] for expense in response.get_json()['expenses']]
+
+def test_reads_rotate_across_replicas(replicas, client):
+    assert [admin_name(client) for _ in range(4)] == REPLICA_NAMES * 2
+
+def test_unreachable_replica_falls_back_to_primary(replicas, client):
+    unreachable = REPLICA_KEYS[len(REPLICA_PATHS)]
+    expense_app.app.config['READ_REPLICA_KEYS'] = [unreachable, REPLICA_KEYS[0]]
+
+    # The failing replica's request is retried on the primary, then the replica is skipped
+    assert admin_name(client) not in REPLICA_NAMES
+    assert unreachable in expense_app._replica_down_until
+    assert [admin_name(client) for _ in range(3)] == ['Replica A'] * 3
+
+def test_writer_is_pinned_to_primary(replicas, client):
+    response = client.post('/api/expenses', json={
+        'user_id': 4, 'title': 'Replica lag check', 'amount': 15, 'category': 'Other', 'date': '2026-03-01'
+    })
+    assert response.status_code == 201
+    expense_id = response.get_json()['expense']['id']
+    assert client.get_cookie('rw_sticky') is not None
+
+    # The writer reads its own write, though the replicas haven't seen it
+    assert expense_id in expense_ids(client, 4)
+    assert admin_name(client) not in REPLICA_NAMES
+
+    # Other clients keep reading from the replicas
+    other = expense_app.app.test_client()
+    assert admin_name(other) in REPLICA_NAMES
+    # Once the pin expires the writer is back on a replica, too
+    client.delete_cookie('rw_sticky')
+    expense_app._recent_writers.clear()
+    assert expense_id not in expense_ids(client, 4)
@@ -0,0 +1,54 @@
+import itertools
+
+import pytest
+
+_names = itertools.count()
+
+@pytest.fixture
+def other_company(client):
+    response = client.post('/api/companies', json={
+        'name': f'Other Company {next(_names)}', 'admin': {'email': f'admin{next(_names)}@other.test', 'password': 'secret'}
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['company']['id'], response.get_json()['admin']['id']
+
+def upload(client, expense_id, body, company_id=None):
+    headers = {'X-Company-Id': str(company_id)} if company_id else {}
+    return client.post(f'/api/expenses/{expense_id}/receipt', data=body, content_type='image/png', headers=headers)
+
+def test_receipts_are_only_visible_to_their_company(client, other_company):
+    other_company, _ = other_company
+    response = upload(client, 1, b'not really a png, company one')
+    assert response.status_code == 201
+    url = response.get_json()['receipt']['url']
+
+    own = client.get(url)
+    assert own.status_code == 200
+    assert 'private' in own.headers['Cache-Control']
+    assert client.get(url, headers={'X-Company-Id': str(other_company)}).status_code == 404
+    assert client.get(f'{url}/thumbnail', headers={'X-Company-Id': str(other_company)}).status_code == 404
+
+def test_companies_keep_separate_rows_for_the_same_file(client, other_company):
+    company_id, admin_id = other_company
+    expense = client.post('/api/expenses', headers={'X-Company-Id': str(company_id)}, json={
+        'user_id': admin_id, 'title': 'Other company lunch', 'amount': 12, 'category': 'Other', 'date': '2026-04-01'
+    })
+    assert expense.status_code == 201, expense.get_json()
+
+    body = b'the same receipt, uploaded by two companies'
+    assert upload(client, 1, body).status_code == 201
+    response = upload(client, expense.get_json()['expense']['id'], body, company_id)
+    assert response.status_code == 201
+    assert client.get(response.get_json()['receipt']['url'], headers={'X-Company-Id': str(company_id)}).status_code == 200
+
+def test_companies_can_reuse_an_email(client):
+    response = client.post('/api/companies', json={
+        'name': 'Email Reuse Inc', 'admin': {'email': 'admin@company.com', 'password': 'secret'}
+    })
+    assert response.status_code == 201, response.get_json()
+    company_id = response.get_json()['company']['id']
+
+    login = client.post('/api/auth/login', headers={'X-Company-Id': str(company_id)},
+                        json={'email': 'admin@company.com', 'password': 'secret'})
+    assert login.status_code == 200
+    assert login.get_json()['user']['id'] == response.get_json()['admin']['id']
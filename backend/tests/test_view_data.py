@@ -0,0 +1,28 @@
+import app as expense_app
+from view_data import build_query, parse_args, summarize
+
+def step_counts(argv):
+    with expense_app.app.app_context():
+        return summarize(parse_args(['--summary'] + argv))['steps']
+
+def test_summary_step_counts_follow_filters():
+    everything = step_counts([])
+    for_manager = step_counts(['--user-id', '2'])
+    waiting = step_counts(['--status', 'Waiting'])
+
+    assert sum(for_manager.values()) < sum(everything.values())
+    assert set(waiting) == {'Waiting'}
+    assert waiting['Waiting'] == everything['Waiting']
+    assert step_counts(['--user-id', '2', '--status', 'Waiting']).get('Waiting', 0) <= for_manager.get('Waiting', 0)
+
+def test_summary_matches_streamed_rows():
+    for argv in ([], ['--status', 'Approved'], ['--user-id', '4'], ['--user-id', '2', '--status', 'Pending']):
+        args = parse_args(['--summary'] + argv)
+        with expense_app.app.app_context():
+            summary = summarize(args)
+            rows = {table: build_query(table, args).count() for table in ('users', 'expenses', 'steps', 'policies', 'notifications')}
+        assert summary['users'] == rows['users']
+        assert sum(totals['count'] for totals in summary['expenses'].values()) == rows['expenses']
+        assert sum(summary['steps'].values()) == rows['steps']
+        assert summary['policies'] == rows['policies']
+        assert summary['notifications'] == rows['notifications']
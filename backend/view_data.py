@@ -1,42 +1,185 @@
-from app import app, db, User, Expense, ApprovalStep, Comment, Policy, Notification
+import argparse
+import json
+import sys
+from datetime import datetime
 
-def view_all_data():
+from flask import g
+
+from app import app, db, User, Expense, ApprovalStep, Policy, Notification
+
+TABLES = ('users', 'expenses', 'steps', 'policies', 'notifications')
+
+# Shared by the row listings and the summary
+def table_filters(table, args):
+    filters = []
+    if table == 'users':
+        if args.user_id:
+            filters.append(User.id == args.user_id)
+    elif table == 'expenses':
+        if args.user_id:
+            filters.append(Expense.user_id == args.user_id)
+        if args.status:
+            filters.append(Expense.status == args.status)
+        if args.category:
+            filters.append(Expense.category == args.category)
+        if args.since:
+            filters.append(Expense.date >= args.since)
+    elif table == 'steps':
+        if args.user_id:
+            filters.append(ApprovalStep.approver_id == args.user_id)
+        if args.status:
+            filters.append(ApprovalStep.status == args.status)
+    elif table == 'policies':
+        if args.category:
+            filters.append(Policy.category == args.category)
+    elif args.user_id:
+        filters.append(Notification.user_id == args.user_id)
+    return filters
+
+def build_query(table, args):
+    filters = table_filters(table, args)
+    if table == 'users':
+        query = db.session.query(User.id, User.name, User.email, User.role, User.department)
+        return query.filter(*filters).order_by(User.id)
+
+    if table == 'expenses':
+        query = db.session.query(
+            Expense.id, Expense.title, Expense.amount, Expense.currency, Expense.status,
+            Expense.category, Expense.date, User.name.label('submitter')
+        ).join(User, Expense.user_id == User.id)
+        return query.filter(*filters).order_by(Expense.id)
+
+    if table == 'steps':
+        query = db.session.query(
+            ApprovalStep.id, ApprovalStep.expense_id, ApprovalStep.sequence, ApprovalStep.status,
+            User.name.label('approver')
+        ).join(User, ApprovalStep.approver_id == User.id)
+        return query.filter(*filters).order_by(ApprovalStep.id)
+
+    if table == 'policies':
+        query = db.session.query(
+            Policy.id, Policy.category, Policy.department, Policy.role,
+            Policy.max_amount, Policy.approval_threshold, Policy.approval_levels
+        )
+        return query.filter(*filters).order_by(Policy.id)
+
+    query = db.session.query(Notification.id, Notification.user_id, Notification.title, Notification.message, Notification.is_read)
+    return query.filter(*filters).order_by(Notification.id)
+
+def format_row(table, row):
+    if table == 'users':
+        return f"  {row.id}: {row.name} ({row.email}) - {row.role} - {row.department}"
+    if table == 'expenses':
+        return f"  {row.id}: {row.title} - ${row.amount} - {row.status} - {row.category} - {row.submitter}"
+    if table == 'steps':
+        return f"  Expense {row.expense_id}: Step {row.sequence} - {row.status} - Approver: {row.approver}"
+    if table == 'policies':
+        scope = ', '.join(v for v in (row.department, row.role) if v) or 'all'
+        threshold = f"${row.approval_threshold}" if row.approval_threshold is not None else 'none'
+        return f"  {row.category} ({scope}): Max ${row.max_amount}, Threshold {threshold}, Levels {row.approval_levels}"
+    return f"  {row.title}: {row.message}"
+
+HEADINGS = {
+    'users': '👥 USERS',
+    'expenses': '💰 EXPENSES',
+    'steps': '✅ APPROVAL STEPS',
+    'policies': '📋 POLICIES',
+    'notifications': '🔔 NOTIFICATIONS'
+}
+
+def stream_table(table, args):
+    query = build_query(table, args)
+    if args.limit:
+        query = query.limit(args.limit)
+
+    if not args.json:
+        print(f"\n{HEADINGS[table]}:")
+    count = 0
+    for row in query.yield_per(args.batch_size):
+        count += 1
+        if args.json:
+            print(json.dumps({'table': table, **row._asdict()}, default=str))
+        else:
+            print(format_row(table, row))
+    if not args.json:
+        print(f"  ({count} rows)")
+
+# Counts and totals computed by the database, without loading any rows
+def summarize(args):
+    def count(column, table, *extra):
+        return db.session.query(db.func.count(column)).filter(*table_filters(table, args), *extra).scalar()
+
+    by_status = db.session.query(
+        Expense.status, db.func.count(Expense.id), db.func.coalesce(db.func.sum(Expense.amount), 0)
+    ).filter(*table_filters('expenses', args)).group_by(Expense.status).all()
+    steps_by_status = db.session.query(
+        ApprovalStep.status, db.func.count(ApprovalStep.id)
+    ).filter(*table_filters('steps', args)).group_by(ApprovalStep.status).all()
+
+    return {
+        'users': count(User.id, 'users'),
+        'expenses': {status: {'count': total, 'amount': float(amount)} for status, total, amount in by_status},
+        'steps': dict(steps_by_status),
+        'policies': count(Policy.id, 'policies'),
+        'notifications': count(Notification.id, 'notifications'),
+        'unread_notifications': count(Notification.id, 'notifications', Notification.is_read.is_(False))
+    }
+
+def print_summary(summary):
+    print(f"\n👥 USERS: {summary['users']}")
+    print("\n💰 EXPENSES:")
+    for status, totals in sorted(summary['expenses'].items()):
+        print(f"  {status}: {totals['count']} (${totals['amount']:.2f})")
+    print("\n✅ APPROVAL STEPS:")
+    for status, count in sorted(summary['steps'].items()):
+        print(f"  {status}: {count}")
+    print(f"\n📋 POLICIES: {summary['policies']}")
+    print(f"\n🔔 NOTIFICATIONS: {summary['notifications']} ({summary['unread_notifications']} unread)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect the expense manager database without loading it into memory.')
+    parser.add_argument('--table', action='append', choices=TABLES, help='Table to show (repeatable, default: all)')
+    parser.add_argument('--company-id', type=int, help='Only show data for this company')
+    parser.add_argument('--user-id', type=int, help='Filter by submitter (expenses), approver (steps) or recipient (notifications)')
+    parser.add_argument('--status', help='Filter expenses or approval steps by status')
+    parser.add_argument('--category', help='Filter expenses or policies by category')
+    parser.add_argument('--since', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(), help='Only expenses dated on or after YYYY-MM-DD')
+    parser.add_argument('--limit', type=int, help='Maximum rows per table')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows fetched per round trip (default: 1000)')
+    parser.add_argument('--summary', action='store_true', help='Only print counts and totals')
+    parser.add_argument('--json', action='store_true', help='Print JSON (one object per line) for piping')
+    return parser.parse_args(argv)
+
+def view_all_data(argv=None):
+    args = parse_args(argv)
     with app.app_context():
-        print("=" * 60)
-        print("📊 EXPENSE MANAGER - ALL DATA")
-        print("=" * 60)
-        
-        # Users
-        users = User.query.all()
-        print(f"\n👥 USERS ({len(users)}):")
-        for user in users:
-            print(f"  {user.id}: {user.name} ({user.email}) - {user.role} - {user.department}")
-        
-        # Expenses
-        expenses = Expense.query.all()
-        print(f"\n💰 EXPENSES ({len(expenses)}):")
-        for exp in expenses:
-            print(f"  {exp.id}: {exp.title} - ${exp.amount} - {exp.status} - {exp.category}")
-        
-        # Approval Steps
-        steps = ApprovalStep.query.all()
-        print(f"\n✅ APPROVAL STEPS ({len(steps)}):")
-        for step in steps:
-            print(f"  Expense {step.expense_id}: Step {step.sequence} - {step.status} - Approver: {step.approver.name}")
-        
-        # Policies
-        policies = Policy.query.all()
-        print(f"\n📋 POLICIES ({len(policies)}):")
-        for policy in policies:
-            print(f"  {policy.category}: Max ${policy.max_amount}, Threshold ${policy.approval_threshold}")
-        
-        # Notifications
-        notifications = Notification.query.all()
-        print(f"\n🔔 NOTIFICATIONS ({len(notifications)}):")
-        for notif in notifications:
-            print(f"  {notif.title}: {notif.message}")
-        
-        print("=" * 60)
+        # Without a company the tool sees every company in the primary database
+        g.company_id = args.company_id
+
+        if args.summary:
+            summary = summarize(args)
+            if args.json:
+                print(json.dumps(summary))
+            else:
+                print("=" * 60)
+                print("📊 EXPENSE MANAGER - SUMMARY")
+                print("=" * 60)
+                print_summary(summary)
+                print("=" * 60)
+            return
+
+        if not args.json:
+            print("=" * 60)
+            print("📊 EXPENSE MANAGER - ALL DATA")
+            print("=" * 60)
+        for table in args.table or TABLES:
+            stream_table(table, args)
+        if not args.json:
+            print("=" * 60)
 
 if __name__ == '__main__':
-    view_all_data()
\ No newline at end of file
+    try:
+        view_all_data()
+    except BrokenPipeError:
+        # Output was piped into something like `head`
+        sys.stderr.close()